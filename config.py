@@ -1,4 +1,4 @@
-
+import os
 
 DB_HOST = 'localhost'
 DB_USER = 'root' 
@@ -7,6 +7,9 @@ DB_NAME = 'trackmedi'
 
 SECRET_KEY = 'meditrek_secret_key_2024'
 DEBUG = True
+# HTTPS-only session cookie. Unset: on behind a WSGI server, off for the
+# plain-HTTP dev server (app.run). Set to 1 or 0 to force it.
+SESSION_COOKIE_SECURE = os.environ.get('SESSION_COOKIE_SECURE')
 
 APP_NAME = 'MediTrek'
 APP_PORT = 5000
@@ -24,7 +24,7 @@ def execute_query(query, params=None):
     try:
         with connection.cursor() as cursor:
             cursor.execute(query, params)
-            if query.strip().upper().startswith('SELECT'):
+            if query.lstrip()[:6].upper() == 'SELECT':
                 return cursor.fetchall()
             else:
                 connection.commit()
@@ -1,63 +1,71 @@
 from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_from_directory
 import os
 import bcrypt
+from datetime import timedelta
+from itertools import combinations
+import config
 from database.db_config import execute_query
 from backend.ml.drug_interactions import check_drug_interaction
 
-def generate_timing_advice(drug1, drug2, severity, description):
-    """Generate dynamic timing advice based on interaction risk analysis"""
-    
-    # Risk analysis based on description keywords
-    def analyze_interaction_risk(description):
-        description_lower = description.lower()
-        
-        # High risk keywords
-        high_risk_keywords = [
-            'bleeding', 'hemorrhage', 'death', 'fatal', 'life-threatening', 
-            'cardiac arrest', 'heart failure', 'severe', 'critical', 'emergency',
-            'overdose', 'toxicity', 'kidney failure', 'liver damage', 'stroke'
-        ]
-        
-        # Medium risk keywords  
-        medium_risk_keywords = [
-            'increase', 'decrease', 'reduce', 'enhance', 'potentiate', 'inhibit',
-            'metabolism', 'absorption', 'excretion', 'side effects', 'adverse',
-            'monitor', 'caution', 'warning', 'risk', 'interaction'
-        ]
-        
-        # Count risk indicators
-        high_risk_count = sum(1 for keyword in high_risk_keywords if keyword in description_lower)
-        medium_risk_count = sum(1 for keyword in medium_risk_keywords if keyword in description_lower)
-        
-        return high_risk_count, medium_risk_count
-    
-    # Analyze the interaction risk
-    high_risk_count, medium_risk_count = analyze_interaction_risk(description)
-    
-    # Determine timing based on severity + risk analysis
-    severity_lower = severity.lower()
-    
+# High risk keywords
+HIGH_RISK_KEYWORDS = (
+    'bleeding', 'hemorrhage', 'death', 'fatal', 'life-threatening', 
+    'cardiac arrest', 'heart failure', 'severe', 'critical', 'emergency',
+    'overdose', 'toxicity', 'kidney failure', 'liver damage', 'stroke'
+)
+
+# Medium risk keywords  
+MEDIUM_RISK_KEYWORDS = (
+    'increase', 'decrease', 'reduce', 'enhance', 'potentiate', 'inhibit',
+    'metabolism', 'absorption', 'excretion', 'side effects', 'adverse',
+    'monitor', 'caution', 'warning', 'risk', 'interaction'
+)
+
+SEVERITY_CODES = {'low': 0, 'medium': 1, 'high': 2}
+
+def _timing_advice_template(severity_code, high_risk_count, medium_risk_count):
+    """Pick the advice template for a severity code and keyword risk counts"""
     # High severity or high risk keywords = longer spacing
-    if severity_lower == 'high' or high_risk_count >= 2:
+    if severity_code == 2 or high_risk_count >= 2:
         if high_risk_count >= 3:  # Very dangerous
-            return f" CRITICAL: Take {drug1} at least 2-3 hours before or after {drug2} (Very dangerous interaction!)"
+            return " CRITICAL: Take {drug1} at least 2-3 hours before or after {drug2} (Very dangerous interaction!)"
         else:  # High severity
-            return f"CRITICAL: Take {drug1} at least 1-2 hours before or after {drug2} (Dangerous interaction!)"
+            return "CRITICAL: Take {drug1} at least 1-2 hours before or after {drug2} (Dangerous interaction!)"
     
     # Medium severity or medium risk keywords = moderate spacing
-    elif severity_lower == 'medium' or medium_risk_count >= 2:
+    elif severity_code == 1 or medium_risk_count >= 2:
         if medium_risk_count >= 3:  # High medium risk
-            return f" Take {drug1} at least 60-90 minutes before or after {drug2} (Moderate-high risk)"
+            return " Take {drug1} at least 60-90 minutes before or after {drug2} (Moderate-high risk)"
         else:  # Normal medium risk
-            return f" Take {drug1} at least 40-60 minutes before or after {drug2} (Moderate risk)"
+            return " Take {drug1} at least 40-60 minutes before or after {drug2} (Moderate risk)"
     
     # Low severity = minimal spacing
     else:
         if medium_risk_count >= 1:  # Some risk detected
-            return f"Take {drug1} at least 30-45 minutes before or after {drug2} (Low-moderate risk)"
+            return "Take {drug1} at least 30-45 minutes before or after {drug2} (Low-moderate risk)"
         else:  # Very low risk
-            return f"Take {drug1} at least 15-20 minutes before or after {drug2} (Low risk)"
+            return "Take {drug1} at least 15-20 minutes before or after {drug2} (Low risk)"
+
+# Templates indexed by severity << 6 | min(high, 7) << 3 | min(medium, 7)
+TIMING_ADVICE_TABLE = [
+    _timing_advice_template(index >> 6, (index >> 3) & 7, index & 7)
+    for index in range(3 << 6)
+]
+
+def generate_timing_advice(drug1, drug2, severity, description):
+    """Generate dynamic timing advice based on interaction risk analysis"""
+    # Count risk indicators
+    description_lower = description.lower()
+    high_risk_count = sum(1 for keyword in HIGH_RISK_KEYWORDS if keyword in description_lower)
+    medium_risk_count = sum(1 for keyword in MEDIUM_RISK_KEYWORDS if keyword in description_lower)
+    
+    # Determine timing based on severity + risk analysis
+    severity_code = SEVERITY_CODES.get(severity.lower(), 0)
+    index = (severity_code << 6) | (min(high_risk_count, 7) << 3) | min(medium_risk_count, 7)
+    return TIMING_ADVICE_TABLE[index].format(drug1=drug1, drug2=drug2)
+
 from datetime import datetime
+import importlib.util
 import io
 import re
 from typing import Dict, Optional
@@ -80,26 +88,20 @@ except ImportError:
     def extract_prescription_data(image):
         return {'success': False, 'error': 'OCR service not available'}
 
-# Optional: PaddleOCR (excellent for handwritten text, pretrained models)
-PADDLEOCR_AVAILABLE = False
+# Optional: PaddleOCR (excellent for handwritten text, pretrained models).
+# Only probed here; paddle itself is imported on first use, not at startup.
 _paddleocr_reader = None
-try:
-    from paddleocr import PaddleOCR  # type: ignore
-    PADDLEOCR_AVAILABLE = True
-except Exception as e:
-    print(f"PaddleOCR not available: {e}")
-    PADDLEOCR_AVAILABLE = False
-
-# Optional: TrOCR (Transformer-based OCR, best for handwritten text)
-TROCR_AVAILABLE = False
+PADDLEOCR_AVAILABLE = importlib.util.find_spec('paddleocr') is not None
+if not PADDLEOCR_AVAILABLE:
+    print("PaddleOCR not available")
+
+# Optional: TrOCR (Transformer-based OCR, best for handwritten text).
+# Same as above: transformers is imported on first use.
 _trocr_processor = None
 _trocr_model = None
-try:
-    from transformers import TrOCRProcessor, VisionEncoderDecoderModel  # type: ignore
-    TROCR_AVAILABLE = True
-except Exception as e:
-    print(f"TrOCR not available: {e}")
-    TROCR_AVAILABLE = False
+TROCR_AVAILABLE = importlib.util.find_spec('transformers') is not None
+if not TROCR_AVAILABLE:
+    print("TrOCR not available")
 
 # ML Services 
 try:
@@ -147,13 +149,31 @@ except ImportError:
     ML_DOSAGE_ENABLED = False
     dosage_optimization_engine = None
 
+# Optional: gzip/brotli response compression for JSON endpoints
+try:
+    from flask_compress import Compress
+    COMPRESS_AVAILABLE = True
+except ImportError:
+    COMPRESS_AVAILABLE = False
+
 app = Flask(__name__)
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+app.config['COMPRESS_LEVEL'] = 4
+app.config['COMPRESS_BR_LEVEL'] = 4
+if COMPRESS_AVAILABLE:
+    Compress(app)
 @app.route('/assets/<path:filename>')
 def serve_asset(filename):
     base_dir = os.path.join(os.path.dirname(__file__), 'database', 'data')
     return send_from_directory(base_dir, filename)
 app.secret_key = 'meditrek_secret_key_2024'
 
+# Signed session cookie: after the first bcrypt check every request is
+# authenticated by an HMAC on session['user_id'] instead of re-hashing
+app.config['SESSION_COOKIE_HTTPONLY'] = True
+app.config['SESSION_COOKIE_SECURE'] = config.SESSION_COOKIE_SECURE != '0'
+app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -174,6 +194,7 @@ def login():
         user_data = user[0]
         try:
             if bcrypt.checkpw(password.encode('utf-8'), user_data['password_hash'].encode('utf-8')):
+                session.permanent = True
                 session['user_id'] = user_data['id']
                 session['user_email'] = user_data['email']
                 return redirect(url_for('dashboard'))
@@ -237,21 +258,20 @@ def dashboard():
     # Check for drug interactions
     interactions = []
     if medicines:
-        medicine_names = [med['medicine_name'] for med in medicines]
-        for i, med1 in enumerate(medicine_names):
-            for med2 in medicine_names[i+1:]:
-                interaction = check_drug_interaction(med1, med2)
-                if interaction:
-                    # Generate timing advice based on severity and interaction type
-                    timing_advice = generate_timing_advice(med1, med2, interaction['severity'], interaction['description'])
-                    interactions.append({
-                        'drug1': med1,
-                        'drug2': med2,
-                        'severity': interaction['severity'],
-                        'description': interaction['description'],
-                        'recommendation': interaction.get('recommendation', ''),
-                        'timing_advice': timing_advice
-                    })
+        medicine_names = sorted(med['medicine_name'] for med in medicines)
+        for med1, med2 in combinations(medicine_names, 2):
+            interaction = check_drug_interaction(med1, med2)
+            if interaction:
+                # Generate timing advice based on severity and interaction type
+                timing_advice = generate_timing_advice(med1, med2, interaction['severity'], interaction['description'])
+                interactions.append({
+                    'drug1': med1,
+                    'drug2': med2,
+                    'severity': interaction['severity'],
+                    'description': interaction['description'],
+                    'recommendation': interaction.get('recommendation', ''),
+                    'timing_advice': timing_advice
+                })
     
     # Get user stats
     stats_query = """
@@ -348,11 +368,9 @@ def add_medicine():
     if existing_meds:
         try:
             from ml_interaction_service import interaction_engine
-            # Use ML-powered interaction checking
-            for existing_med in existing_meds:
-                interaction = interaction_engine.predict_interaction_severity(med_name, existing_med['medicine_name'])
-                if interaction:
-                    interactions.append(interaction)
+            # Use ML-powered interaction checking, one batched call for all pairs
+            pairs = [(med_name, existing_med['medicine_name']) for existing_med in existing_meds]
+            interactions = [interaction for interaction in interaction_engine.predict_batch(pairs) if interaction]
         except ImportError:
             # Fallback to database lookup
             existing_med_names = [med['medicine_name'] for med in existing_meds]
@@ -381,61 +399,73 @@ def add_medicine():
         flash('Failed to add medicine')
         return redirect(url_for('add_medicine_form'))
 
+# Enhanced frequency map with more variations
+PRESCRIPTION_FREQ_MAP = {
+    'once daily': ['od', 'once daily', 'qd', 'daily', 'q.d.', 'q24h', 'q 24h', 'once a day', '1x daily'],
+    'twice daily': ['bd', 'twice daily', 'bid', 'b.i.d', 'b.i.d.', 'q12h', 'q 12h', '2x daily', 'twice a day'],
+    'three times daily': ['tid', 't.d.s', 'tds', 't.i.d', 't.i.d.', 'three times', '3x daily', 'thrice daily'],
+    'four times daily': ['qid', 'q.i.d', 'q.i.d.', 'q6h', 'q 6h', '4x daily', 'four times'],
+    'every 8 hours': ['q8h', 'q 8h', 'every 8 hours', 'every 8 hrs', 'every eight hours'],
+    'every 12 hours': ['q12h', 'q 12h', 'every 12 hours', 'every 12 hrs', 'every twelve hours'],
+    'at bedtime': ['hs', 'qhs', 'at bedtime', 'bedtime', 'night', 'nightly'],
+    'as needed': ['sos', 'prn', 'p.r.n', 'as needed', 'when required', 'as directed'],
+    'every 6 hours': ['q6h', 'q 6h', 'every 6 hours', 'every 6 hrs'],
+}
+# Inverted alias -> frequency; shared aliases (q12h, q6h) keep the first frequency listed
+FREQ_ALIAS_TO_CANONICAL = {
+    alias: freq for freq, aliases in reversed(PRESCRIPTION_FREQ_MAP.items()) for alias in aliases
+}
+# One pass over the line; longest alias first, bounded so "od" doesn't match inside "food"
+FREQ_ALIAS_RE = re.compile(
+    r'(?<![a-z0-9])(?:' + '|'.join(re.escape(a) for a in sorted(FREQ_ALIAS_TO_CANONICAL, key=len, reverse=True)) + r')(?![a-z0-9])'
+)
+
+# Legacy parser patterns, compiled once at import
+RX_DOSAGE_RE = re.compile(
+    r"\b((\d+(?:\.\d+)?)\s*(mg|mcg|g|ml|iu|units|tablet|tab|capsule|cap|drop|drops|tsp|teaspoon))|"
+    r"((\d+(?:\.\d+)?)\s*/\s*(\d+(?:\.\d+)?)\s*(mg|ml))|"
+    r"((\d+(?:\.\d+)?)\s*%\s*(w/w|w/v|cream|ointment))\b",
+    re.IGNORECASE
+)
+
+RX_TIME_RE = re.compile(r"\b(\d{1,2}):(\d{2})\s*(am|pm|AM|PM)\b\.?", re.IGNORECASE)
+RX_HEADER_BLOCKER_RE = re.compile(
+    r"(dr\.?|doctor|physician|patient|dob|age|sex|gender|date|address|phone|license|allergies|weight|height|diagnosis|prescription|rx\s*no|reg\s*no)\b",
+    re.IGNORECASE
+)
+RX_DOSAGE_SPLIT_RE = re.compile(r"\b(mg|mcg|g|ml|iu|units|tablet|tab|capsule|cap|drop|drops|cream|ointment)\b", re.IGNORECASE)
+
+# Multiple medicine line patterns for different prescription formats
+RX_MED_LINE_PATTERNS = [
+    re.compile(r"^\s*\d+\.?\s*([A-Za-z][A-Za-z0-9\-\s]{2,})\s+(\d+(?:\.\d+)?)\s*(mg|mcg|g|ml|iu)\b", re.IGNORECASE),  # "1. Medicine 500mg"
+    re.compile(r"^([A-Za-z][A-Za-z0-9\-\s]{2,})\s+(\d+(?:\.\d+)?)\s*(mg|mcg|g|ml|iu)\s*(tablet|tab|capsule|cap)?", re.IGNORECASE),  # "Medicine 500mg tablet"
+    re.compile(r"^\s*rx\s*[:\.]?\s*([A-Za-z][A-Za-z0-9\-\s]{2,})\s+(\d+(?:\.\d+)?)\s*(mg|mcg|g|ml)", re.IGNORECASE),  # "Rx: Medicine 500mg"
+    re.compile(r"^([A-Z][a-z]+\s+[A-Z][a-z]+)\s+(\d+(?:\.\d+)?)\s*(mg|mcg|g|ml)", re.IGNORECASE),  # "Medicine Name 500mg"
+    re.compile(r"^\s*([A-Za-z][A-Za-z0-9\-\s]{3,})\s*[,:]?\s*(\d+(?:\.\d+)?)\s*(mg|mcg|g|ml)\b", re.IGNORECASE),  # "Medicine: 500mg"
+]
+
+RX_AGE_RE = re.compile(r"\b(age|dob|yrs|years?)\b[\s:]*([0-9]{1,3})", re.IGNORECASE)
+RX_WEIGHT_RE = re.compile(r"\b(weight|wt)\b[\s:]*([0-9]{1,3}(?:\.[0-9]+)?)\s*(kg|kgs|kilograms?)?\b", re.IGNORECASE)
+RX_HEIGHT_RE = re.compile(r"\b(height|ht)\b[\s:]*([0-9]{2,3}(?:\.[0-9]+)?)\s*(cm|cms|centimeters?)?\b", re.IGNORECASE)
+RX_PURPOSE_RE = re.compile(r"\b(purpose|indication|reason|for|diagnosis)\b\s*[:\-]\s*(.+)$", re.IGNORECASE)
+RX_ALLERGIES_RE = re.compile(r"\ballerg(?:y|ies)\b\s*[:\-]\s*(.+)$", re.IGNORECASE)
+RX_WORDY_RE = re.compile(r"[A-Za-z]{3,}")
+RX_LEADING_NUMBERING_RE = re.compile(r"^[\-\d\.\)\s]+")
+RX_LEADING_MARKER_RE = re.compile(r"^r\s*x\s*i?\s*[:\.]?\s*\d*\)?\s*", re.IGNORECASE)
+RX_FORM_WORDS_RE = re.compile(r"\b(tab|tablet|caps|capsule|cap|syrup|drop|drops|inj|injection|ointment|cream)\b\.?,?\s*", re.IGNORECASE)
+
 # Moved to ocr_service.py - keeping for backward compatibility if needed
 def _parse_prescription_text(text: str) -> Dict[str, Optional[str]]:
     """Extract medicine name, dosage and frequency heuristically from OCR text."""
     lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
     
-    # Enhanced dosage patterns - handle more formats
-    dosage_pattern = re.compile(
-        r"\b((\d+(?:\.\d+)?)\s*(mg|mcg|g|ml|iu|units|tablet|tab|capsule|cap|drop|drops|tsp|teaspoon))|"
-        r"((\d+(?:\.\d+)?)\s*/\s*(\d+(?:\.\d+)?)\s*(mg|ml))|"
-        r"((\d+(?:\.\d+)?)\s*%\s*(w/w|w/v|cream|ointment))\b",
-        re.IGNORECASE
-    )
-    
-    # Enhanced frequency map with more variations
-    freq_map = {
-        'once daily': ['od', 'once daily', 'qd', 'daily', 'q.d.', 'q24h', 'q 24h', 'once a day', '1x daily'],
-        'twice daily': ['bd', 'twice daily', 'bid', 'b.i.d', 'b.i.d.', 'q12h', 'q 12h', '2x daily', 'twice a day'],
-        'three times daily': ['tid', 't.d.s', 'tds', 't.i.d', 't.i.d.', 'three times', '3x daily', 'thrice daily'],
-        'four times daily': ['qid', 'q.i.d', 'q.i.d.', 'q6h', 'q 6h', '4x daily', 'four times'],
-        'every 8 hours': ['q8h', 'q 8h', 'every 8 hours', 'every 8 hrs', 'every eight hours'],
-        'every 12 hours': ['q12h', 'q 12h', 'every 12 hours', 'every 12 hrs', 'every twelve hours'],
-        'at bedtime': ['hs', 'qhs', 'at bedtime', 'bedtime', 'night', 'nightly'],
-        'as needed': ['sos', 'prn', 'p.r.n', 'as needed', 'when required', 'as directed'],
-        'every 6 hours': ['q6h', 'q 6h', 'every 6 hours', 'every 6 hrs'],
-    }
-
-    time_pattern = re.compile(r"\b(\d{1,2}):(\d{2})\s*(am|pm|AM|PM)\b\.?", re.IGNORECASE)
-    header_blockers = re.compile(
-        r"(dr\.?|doctor|physician|patient|dob|age|sex|gender|date|address|phone|license|allergies|weight|height|diagnosis|prescription|rx\s*no|reg\s*no)\b",
-        re.IGNORECASE
-    )
-    dosage_split_tokens = re.compile(r"\b(mg|mcg|g|ml|iu|units|tablet|tab|capsule|cap|drop|drops|cream|ointment)\b", re.IGNORECASE)
-    
-    # Multiple medicine line patterns for different prescription formats
-    med_line_patterns = [
-        re.compile(r"^\s*\d+\.?\s*([A-Za-z][A-Za-z0-9\-\s]{2,})\s+(\d+(?:\.\d+)?)\s*(mg|mcg|g|ml|iu)\b", re.IGNORECASE),  # "1. Medicine 500mg"
-        re.compile(r"^([A-Za-z][A-Za-z0-9\-\s]{2,})\s+(\d+(?:\.\d+)?)\s*(mg|mcg|g|ml|iu)\s*(tablet|tab|capsule|cap)?", re.IGNORECASE),  # "Medicine 500mg tablet"
-        re.compile(r"^\s*rx\s*[:\.]?\s*([A-Za-z][A-Za-z0-9\-\s]{2,})\s+(\d+(?:\.\d+)?)\s*(mg|mcg|g|ml)", re.IGNORECASE),  # "Rx: Medicine 500mg"
-        re.compile(r"^([A-Z][a-z]+\s+[A-Z][a-z]+)\s+(\d+(?:\.\d+)?)\s*(mg|mcg|g|ml)", re.IGNORECASE),  # "Medicine Name 500mg"
-        re.compile(r"^\s*([A-Za-z][A-Za-z0-9\-\s]{3,})\s*[,:]?\s*(\d+(?:\.\d+)?)\s*(mg|mcg|g|ml)\b", re.IGNORECASE),  # "Medicine: 500mg"
-    ]
-    
-    age_pattern = re.compile(r"\b(age|dob|yrs|years?)\b[\s:]*([0-9]{1,3})", re.IGNORECASE)
-    weight_pattern = re.compile(r"\b(weight|wt)\b[\s:]*([0-9]{1,3}(?:\.[0-9]+)?)\s*(kg|kgs|kilograms?)?\b", re.IGNORECASE)
-    height_pattern = re.compile(r"\b(height|ht)\b[\s:]*([0-9]{2,3}(?:\.[0-9]+)?)\s*(cm|cms|centimeters?)?\b", re.IGNORECASE)
-    purpose_pattern = re.compile(r"\b(purpose|indication|reason|for|diagnosis)\b\s*[:\-]\s*(.+)$", re.IGNORECASE)
-    allergies_pattern = re.compile(r"\ballerg(?:y|ies)\b\s*[:\-]\s*(.+)$", re.IGNORECASE)
-
     extracted: Dict[str, Optional[str]] = { 'med_name': None, 'dosage': None, 'frequency': None, 'time': None }
     extra: Dict[str, Optional[str]] = { 'purpose': None, 'age': None, 'age_group': None, 'weight': None, 'height': None, 'allergies': None }
 
     for ln in lines:
         # Try multiple medicine line patterns
         if extracted['med_name'] is None or extracted['dosage'] is None:
-            for pattern in med_line_patterns:
+            for pattern in RX_MED_LINE_PATTERNS:
                 ml = pattern.search(ln)
                 if ml:
                     name = ml.group(1).strip(' -,:')
@@ -453,7 +483,7 @@ def _parse_prescription_text(text: str) -> Dict[str, Optional[str]]:
 
         # dosage - enhanced pattern matching
         if extracted['dosage'] is None:
-            d = dosage_pattern.search(ln)
+            d = RX_DOSAGE_RE.search(ln)
             if d:
                 # Extract the full match, prioritizing grouped patterns
                 for group in d.groups():
@@ -463,21 +493,19 @@ def _parse_prescription_text(text: str) -> Dict[str, Optional[str]]:
 
         # frequency
         if extracted['frequency'] is None:
-            low = ln.lower()
-            for freq, keys in freq_map.items():
-                if any(k in low for k in keys):
-                    extracted['frequency'] = freq
-                    break
+            fm = FREQ_ALIAS_RE.search(ln.lower())
+            if fm:
+                extracted['frequency'] = FREQ_ALIAS_TO_CANONICAL[fm.group(0)]
 
         # explicit time (e.g., 9:00 AM)
         if extracted['time'] is None:
-            t = time_pattern.search(ln)
+            t = RX_TIME_RE.search(ln)
             if t:
                 extracted['time'] = t.group(1) + ' ' + t.group(2).upper()
 
         # demographics and purpose/allergies
         if extra['age'] is None:
-            am = age_pattern.search(ln)
+            am = RX_AGE_RE.search(ln)
             if am:
                 try:
                     age_val = int(am.group(2))
@@ -491,33 +519,33 @@ def _parse_prescription_text(text: str) -> Dict[str, Optional[str]]:
                 except Exception:
                     pass
         if extra['weight'] is None:
-            wm = weight_pattern.search(ln)
+            wm = RX_WEIGHT_RE.search(ln)
             if wm:
                 extra['weight'] = wm.group(2)
         if extra['height'] is None:
-            hm = height_pattern.search(ln)
+            hm = RX_HEIGHT_RE.search(ln)
             if hm:
                 extra['height'] = hm.group(2)
         if extra['purpose'] is None:
-            pm = purpose_pattern.search(ln)
+            pm = RX_PURPOSE_RE.search(ln)
             if pm:
                 extra['purpose'] = pm.group(2).strip()
         if extra['allergies'] is None:
-            alm = allergies_pattern.search(ln)
+            alm = RX_ALLERGIES_RE.search(ln)
             if alm:
                 extra['allergies'] = alm.group(1).strip()
 
         # medicine name heuristic: first line that looks like a wordy token and not Doctor/Patient headers
         if extracted['med_name'] is None:
-            if re.search(r"[A-Za-z]{3,}", ln) and not header_blockers.search(ln):
+            if RX_WORDY_RE.search(ln) and not RX_HEADER_BLOCKER_RE.search(ln):
                 # remove leading bullets or numbering
-                cand = re.sub(r"^[\-\d\.\)\s]+", "", ln)
+                cand = RX_LEADING_NUMBERING_RE.sub("", ln)
                 # remove leading rx markers like 'Rx', 'Rx1.', 'Rxi'
-                cand = re.sub(r"^r\s*x\s*i?\s*[:\.]?\s*\d*\)?\s*", "", cand, flags=re.IGNORECASE)
+                cand = RX_LEADING_MARKER_RE.sub("", cand)
                 # strip common instructions
-                cand = re.sub(r"\b(tab|tablet|caps|capsule|cap|syrup|drop|drops|inj|injection|ointment|cream)\b\.?,?\s*", "", cand, flags=re.IGNORECASE)
+                cand = RX_FORM_WORDS_RE.sub("", cand)
                 # If dosage unit exists in same line, split name before it
-                split_match = dosage_split_tokens.search(cand)
+                split_match = RX_DOSAGE_SPLIT_RE.search(cand)
                 name_part = cand
                 if split_match:
                     name_part = cand[:split_match.start()].strip(' -,:')
@@ -543,41 +571,36 @@ def _preprocess_for_handwriting(image: Image.Image) -> Image.Image:
     if image.mode != 'L':
         image = image.convert('L')
     
-    # Convert to numpy for advanced processing
-    img_array = np.array(image)
-    
-    # 1. Denoise (median filter for handwritten text)
     try:
         from scipy import ndimage
-        img_array = ndimage.median_filter(img_array, size=3)
     except ImportError:
-        # Fallback: PIL median filter
-        image = image.filter(ImageFilter.MedianFilter(size=3))
-        img_array = np.array(image)
+        ndimage = None
+    
+    if ndimage is not None:
+        # Binarization reads the median-filtered pixels only, so this path
+        # stays in numpy and skips the PIL contrast/sharpen passes
+        # 1. Denoise (median filter for handwritten text)
+        img_array = ndimage.median_filter(np.asarray(image), size=3)
+        
+        # 2. Binarization (OTSU-like thresholding for handwritten text)
+        threshold = np.mean(ndimage.gaussian_filter(img_array, sigma=1.0))
+        binary = np.where(img_array > threshold * 0.9, 255, 0).astype(np.uint8)
+        return Image.fromarray(binary, mode='L')
     
-    # 2. Enhance contrast aggressively for handwriting
-    image = Image.fromarray(img_array)
-    enhancer = ImageEnhance.Contrast(image)
-    image = enhancer.enhance(2.0)  # Increase contrast
+    # Fallback without scipy: PIL median filter
+    image = image.filter(ImageFilter.MedianFilter(size=3))
     
-    # 3. Auto-contrast
+    # Enhance contrast aggressively for handwriting
+    image = ImageEnhance.Contrast(image).enhance(2.0)
+    
+    # Auto-contrast
     image = ImageOps.autocontrast(image, cutoff=5)
     
-    # 4. Sharpen
+    # Sharpen
     image = image.filter(ImageFilter.SHARPEN)
     
-    # 5. Binarization (OTSU-like thresholding for handwritten text)
-    try:
-        from scipy.ndimage import gaussian_filter
-        blurred = gaussian_filter(img_array, sigma=1.0)
-        threshold = np.mean(blurred)
-        binary = np.where(img_array > threshold * 0.9, 255, 0).astype(np.uint8)
-        image = Image.fromarray(binary, mode='L')
-    except ImportError:
-        # Fallback: simple threshold
-        image = ImageOps.autocontrast(image)
-    
-    return image
+    # Simple threshold stand-in
+    return ImageOps.autocontrast(image)
 
 # OCR functions moved to ocr_service.py
 
@@ -587,27 +610,22 @@ def _paddleocr_text_from_image(image: Image.Image) -> str:
     if not PADDLEOCR_AVAILABLE:
         raise RuntimeError('PaddleOCR not available')
     if _paddleocr_reader is None:
+        from paddleocr import PaddleOCR  # type: ignore
         # Initialize with English model, optimized for handwritten text
         _paddleocr_reader = PaddleOCR(use_angle_cls=True, lang='en', use_gpu=False)
     
-    import tempfile, os as _os
-    with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp:
-        image.save(tmp.name, format='PNG')
-        tmp_path = tmp.name
-    try:
-        results = _paddleocr_reader.ocr(tmp_path, cls=True)
-        # Extract text from results
-        text_lines = []
-        if results and results[0]:
-            for line in results[0]:
-                if line and len(line) >= 2:
-                    text_lines.append(line[1][0])  # text is at [1][0]
-        return "\n".join(text_lines)
-    finally:
-        try:
-            _os.remove(tmp_path)
-        except Exception:
-            pass
+    import numpy as np
+    
+    # PaddleOCR takes arrays directly; BGR channel order, as cv2.imread would give
+    img_array = np.asarray(image.convert('RGB'))[:, :, ::-1]
+    results = _paddleocr_reader.ocr(img_array, cls=True)
+    # Extract text from results
+    text_lines = []
+    if results and results[0]:
+        for line in results[0]:
+            if line and len(line) >= 2:
+                text_lines.append(line[1][0])  # text is at [1][0]
+    return "\n".join(text_lines)
 
 def _trocr_text_from_image(image: Image.Image) -> str:
     """TrOCR - Transformer-based OCR, best for handwritten text (pretrained model)"""
@@ -617,6 +635,7 @@ def _trocr_text_from_image(image: Image.Image) -> str:
     
     # Lazy load model (first time only)
     if _trocr_processor is None or _trocr_model is None:
+        from transformers import TrOCRProcessor, VisionEncoderDecoderModel  # type: ignore
         # Use pretrained handwritten model
         _trocr_processor = TrOCRProcessor.from_pretrained('microsoft/trocr-base-handwritten')
         _trocr_model = VisionEncoderDecoderModel.from_pretrained('microsoft/trocr-base-handwritten')
@@ -672,7 +691,10 @@ def extract_prescription():
 
     try:
         img_bytes = file.read()
-        image = Image.open(io.BytesIO(img_bytes)).convert('RGB')
+        image = Image.open(io.BytesIO(img_bytes))
+        # OCR only needs grayscale: JPEGs decode straight to luma, and other
+        # formats are converted to L once inside the OCR service
+        image.draft('L', image.size)
         
         # Use OCR service to extract prescription data
         result = extract_prescription_data(image)
@@ -735,30 +757,26 @@ def take_medicine():
         user_id = session['user_id']
         medicine_id = request.json.get('medicine_id')
         
-        # Get current medicine data
-        med_query = "SELECT * FROM user_medicines WHERE id = %s AND user_id = %s"
-        medicine = execute_query(med_query, (medicine_id, user_id))
-        
-        if not medicine:
-            return jsonify({'success': False, 'error': 'Medicine not found'})
-        
-        medicine = medicine[0]
-        current_doses = medicine.get('daily_doses_taken', 0)
-        total_required = medicine.get('total_doses_required', 1)
-        
-        # Incrementipon dose k;a daily
-        new_doses = min(current_doses + 1, total_required)
-        
-        # Update database medipcipne vla
+        # Increment the daily dose in SQL, capped at the daily requirement
         query = """
             UPDATE user_medicines 
-            SET daily_doses_taken = %s,
+            SET daily_doses_taken = LEAST(daily_doses_taken + 1, total_doses_required),
                 last_taken_date = CURDATE(),
                 adherence_score = LEAST(adherence_score + 5, 100),
                 last_taken = NOW()
             WHERE id = %s AND user_id = %s
         """
-        execute_query(query, (new_doses, medicine_id, user_id))
+        execute_query(query, (medicine_id, user_id))
+        
+        # Read back the updated counters
+        med_query = "SELECT daily_doses_taken, total_doses_required FROM user_medicines WHERE id = %s AND user_id = %s"
+        medicine = execute_query(med_query, (medicine_id, user_id))
+        
+        if not medicine:
+            return jsonify({'success': False, 'error': 'Medicine not found'})
+        
+        new_doses = medicine[0]['daily_doses_taken']
+        total_required = medicine[0]['total_doses_required']
         
         # Gameipfiped : bdge vgera k; liye
         points = 0
@@ -881,4 +899,8 @@ if __name__ == '__main__':
     print("Starting MediTrek Flask App...")
     print("Database: 231 medicines, 375 interactions")
     print("URL: http://localhost:5000")
+    # The dev server speaks plain HTTP, where browsers drop Secure cookies
+    if config.SESSION_COOKIE_SECURE is None:
+        app.config['SESSION_COOKIE_SECURE'] = False
+    print(f"Secure session cookie: {app.config['SESSION_COOKIE_SECURE']} (SESSION_COOKIE_SECURE=1/0 to override)")
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,39 @@
+"""
+Export the trained TF-IDF + RandomForest models to ONNX.
+
+One-time offline step, run from the project root after extracting
+ml/Models.zip (requires scikit-learn and skl2onnx):
+
+    python ml/export_onnx.py
+
+The engines pick up ml/Models/<name>.onnx through onnxruntime when it is
+installed and fall back to the pickled models otherwise.
+"""
+import joblib
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.pipeline import Pipeline
+from skl2onnx import to_onnx
+from skl2onnx.common.data_types import StringTensorType
+
+MODELS = {
+    'interaction': ('ml/Models/interaction_tfidf.pkl', 'ml/Models/interaction_model.pkl'),
+    'recommendation': ('ml/Models/recommendation_tfidf.pkl', 'ml/Models/recommendation_model.pkl'),
+}
+
+
+def export(name, tfidf_path, model_path):
+    pipeline = Pipeline([('tfidf', joblib.load(tfidf_path)), ('rf', joblib.load(model_path))])
+    onx = to_onnx(
+        pipeline,
+        initial_types=[('input', StringTensorType([None, 1]))],
+        # Plain probability matrix instead of a list of per-class dicts
+        options={RandomForestClassifier: {'zipmap': False}},
+    )
+    with open(f'ml/Models/{name}.onnx', 'wb') as f:
+        f.write(onx.SerializeToString())
+    print(f"Exported ml/Models/{name}.onnx")
+
+
+if __name__ == '__main__':
+    for name, (tfidf_path, model_path) in MODELS.items():
+        export(name, tfidf_path, model_path)
@@ -1,12 +1,17 @@
-import pickle
+import joblib
 import pandas as pd
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.ensemble import RandomForestRegressor
 import numpy as np
 from database.db_config import execute_query
+from ml_engine_base import TfidfModelMixin
 import re
+import threading
 
-class DosageOptimizationEngine:
+# First number in a dosage string, e.g. "500" in "500 mg"
+_NUMBER_RE = re.compile(r'\d+\.?\d*')
+
+class DosageOptimizationEngine(TfidfModelMixin):
     def __init__(self):
         self.model = None
         self.tfidf = None
@@ -14,25 +19,28 @@ class DosageOptimizationEngine:
     
     def load_model(self):
         try:
-            # Try to load trained model files
-            with open('ml/Models/dosage_model.pkl', 'rb') as f:
-                self.model = pickle.load(f)
-            with open('ml/Models/dosage_tfidf.pkl', 'rb') as f:
-                self.tfidf = pickle.load(f)
+            # Try to load trained model files; numpy arrays are memory-mapped
+            # read-only so forked workers share the pages
+            self.model = joblib.load('ml/Models/dosage_model.pkl', mmap_mode='r')
+            self.tfidf = joblib.load('ml/Models/dosage_tfidf.pkl', mmap_mode='r')
             print("✅ Dosage Optimization ML Model loaded successfully!")
         except FileNotFoundError:
             print("⚠️ Dosage Optimization ML Model files not found, using database lookup")
             self.model = None
     
+    def _warmup_predict(self, texts):
+        # Regressor with no ONNX export: warm the pickled pipeline directly
+        return self.model.predict(self.tfidf.transform(texts))
+    
     def extract_dosage_value(self, dosage_text):
         """Extract numerical dosage value from text"""
         if not dosage_text:
             return 0
         
         # Extract numbers from dosage text
-        numbers = re.findall(r'\d+\.?\d*', str(dosage_text))
-        if numbers:
-            return float(numbers[0])
+        number = _NUMBER_RE.search(str(dosage_text))
+        if number:
+            return float(number.group(0))
         return 0
     
     def predict_optimal_dosage(self, medicine_name, age_group='adult', weight=None):
@@ -66,7 +74,8 @@ class DosageOptimizationEngine:
     def get_database_dosage(self, medicine_name, age_group='adult'):
         """Get dosage from database"""
         query = """
-            SELECT * FROM dosage_optimization 
+            SELECT pediatric_dosage, elderly_dosage, adult_dosage
+            FROM dosage_optimization 
             WHERE medicine_name LIKE %s
             LIMIT 1
         """
@@ -89,8 +98,7 @@ class DosageOptimizationEngine:
                 'predicted_dosage': dosage_value,
                 'confidence': 0.9,  # High confidence for database results
                 'source': 'Database',
-                'recommendation': f"Database suggests {dosage_text} for {age_group}",
-                'full_dosage_info': dosage_data
+                'recommendation': f"Database suggests {dosage_text} for {age_group}"
             }
         
         return None
@@ -131,3 +139,4 @@ class DosageOptimizationEngine:
 
 # Global instance
 dosage_engine = DosageOptimizationEngine()
+threading.Thread(target=dosage_engine.warmup, daemon=True).start()
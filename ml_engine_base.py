@@ -0,0 +1,41 @@
+import numpy as np
+
+# Optional: ONNX Runtime for exported models (see ml/export_onnx.py)
+try:
+    import onnxruntime
+    ONNXRUNTIME_AVAILABLE = True
+except ImportError:
+    ONNXRUNTIME_AVAILABLE = False
+
+class TfidfModelMixin:
+    """Prediction and warmup shared by the engines holding self.model / self.tfidf"""
+    session = None
+
+    def load_onnx_session(self, path):
+        """Load the exported TF-IDF + forest pipeline if present; pickles stay the fallback"""
+        if not ONNXRUNTIME_AVAILABLE:
+            return
+        try:
+            self.session = onnxruntime.InferenceSession(path, providers=['CPUExecutionProvider'])
+            print(f"✅ ONNX session loaded from {path}")
+        except Exception:
+            self.session = None
+
+    def _predict_proba(self, texts):
+        """Class probabilities for raw input texts"""
+        if self.session is not None:
+            inputs = np.array(texts, dtype=object).reshape(-1, 1)
+            return self.session.run(['probabilities'], {'input': inputs})[0]
+        return self.model.predict_proba(self.tfidf.transform(texts))
+
+    def _warmup_predict(self, texts):
+        return self._predict_proba(texts)
+
+    def warmup(self):
+        """Run one dummy prediction so the first request sees warm sklearn/BLAS state"""
+        if not self.model:
+            return
+        try:
+            self._warmup_predict(["warm up"])
+        except Exception as e:
+            print(f"ML warmup error: {e}")
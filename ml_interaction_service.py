@@ -1,112 +1,197 @@
-import pickle
+import joblib
 import pandas as pd
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.ensemble import RandomForestClassifier
 import numpy as np
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import combinations
+from cachetools import LRUCache, TTLCache
 from database.db_config import execute_query
+from ml_engine_base import TfidfModelMixin
 
-class DrugInteractionEngine:
+# SQL built once at import; only the parameters change per call
+_Q_INTERACTION = """
+    SELECT * FROM interactions 
+    WHERE (drug1 = %s AND drug2 = %s) OR (drug1 = %s AND drug2 = %s)
+    ORDER BY 
+        CASE severity_level 
+            WHEN 'High' THEN 1 
+            WHEN 'Medium' THEN 2 
+            WHEN 'Low' THEN 3 
+            ELSE 4 
+        END
+    LIMIT 1
+"""
+
+_Q_KNOWN_PAIRS = "SELECT drug1, drug2 FROM interactions"
+
+class DrugInteractionEngine(TfidfModelMixin):
+    # Severity labels indexed by model prediction
+    SEVERITY_LEVELS = ('Low', 'Medium', 'High')
+    
     def __init__(self):
         self.model = None
         self.tfidf = None
         self.label_encoder = None
+        # Results keyed by normalized drug pair, shared across users/sessions;
+        # predictions keep only (severity, confidence), the text is per call
+        self._prediction_cache = LRUCache(maxsize=4096)
+        self._database_cache = TTLCache(maxsize=1024, ttl=600)
+        self._known_pairs_cache = TTLCache(maxsize=1, ttl=600)
+        self._cache_lock = threading.Lock()
         self.load_model()
     
+    @staticmethod
+    def _pair_key(drug1, drug2):
+        """Order-independent, case-insensitive cache key for a drug pair"""
+        return tuple(sorted((drug1.strip().lower(), drug2.strip().lower())))
+    
     def load_model(self):
         try:
-            # Try to load trained model files
-            with open('ml/Models/interaction_model.pkl', 'rb') as f:
-                self.model = pickle.load(f)
-            with open('ml/Models/interaction_tfidf.pkl', 'rb') as f:
-                self.tfidf = pickle.load(f)
-            with open('ml/Models/interaction_label_encoder.pkl', 'rb') as f:
-                self.label_encoder = pickle.load(f)
+            # Try to load trained model files; numpy arrays are memory-mapped
+            # read-only so forked workers share the pages
+            self.model = joblib.load('ml/Models/interaction_model.pkl', mmap_mode='r')
+            self.tfidf = joblib.load('ml/Models/interaction_tfidf.pkl', mmap_mode='r')
+            self.label_encoder = joblib.load('ml/Models/interaction_label_encoder.pkl')
             print(" Drug Interaction ML Model loaded successfully!")
         except FileNotFoundError:
             print(" Drug Interaction ML Model files not found, using database lookup")
             self.model = None
+            return
+        self.load_onnx_session('ml/Models/interaction.onnx')
     
     def predict_interaction_severity(self, drug1, drug2):
         """Predict interaction severity using ML model"""
+        return self.predict_batch([(drug1, drug2)])[0]
+    
+    def predict_batch(self, pairs):
+        """Predict interaction severity for many (drug1, drug2) pairs in one ML call"""
+        if not pairs:
+            return []
         if not self.model:
-            return self.get_database_interaction(drug1, drug2)
+            return self.get_database_interactions(pairs)
         
-        try:
-            # Combine drug names for prediction
-            drug_text = f"{drug1} {drug2}"
-            
-            # Transform using TF-IDF
-            X = self.tfidf.transform([drug_text])
-            
-            # Get prediction
-            prediction = self.model.predict(X)[0]
-            probability = self.model.predict_proba(X)[0]
-            
-            # Get confidence
-            confidence = max(probability)
-            
-            # Map prediction to severity
-            severity_map = {0: 'Low', 1: 'Medium', 2: 'High'}
-            predicted_severity = severity_map.get(prediction, 'Unknown')
-            
-            return {
-                'severity': predicted_severity,
-                'confidence': confidence,
-                'description': f"ML predicted {predicted_severity} interaction between {drug1} and {drug2}",
-                'recommendation': f"Consult healthcare provider before combining {drug1} and {drug2}",
-                'source': 'ML Model'
-            }
+        keys = [self._pair_key(drug1, drug2) for drug1, drug2 in pairs]
+        with self._cache_lock:
+            scores = {key: self._prediction_cache.get(key) for key in keys}
+        missing = {}
+        for key, pair in zip(keys, pairs):
+            if scores[key] is None:
+                missing.setdefault(key, pair)
+        
+        if missing:
+            try:
+                # One TF-IDF transform and one predict_proba for all uncached pairs
+                probabilities = self._predict_proba([f"{drug1} {drug2}" for drug1, drug2 in missing.values()])
+                predictions = self.model.classes_[probabilities.argmax(axis=1)]
+                confidences = probabilities.max(axis=1)
+                
+                for key, prediction, confidence in zip(missing, predictions, confidences):
+                    scores[key] = (self._severity_label(prediction), confidence)
+                
+            except Exception as e:
+                print(f"ML batch prediction error: {e}")
+                return self.get_database_interactions(pairs)
             
-        except Exception as e:
-            print(f"ML prediction error: {e}")
-            return self.get_database_interaction(drug1, drug2)
+            with self._cache_lock:
+                for key in missing:
+                    self._prediction_cache[key] = scores[key]
+        
+        return [self._build_ml_result(drug1, drug2, *scores[key]) for key, (drug1, drug2) in zip(keys, pairs)]
+    
+    def _severity_label(self, prediction):
+        """Map a raw model prediction to its severity label"""
+        try:
+            return self.SEVERITY_LEVELS[prediction]
+        except (IndexError, TypeError):
+            return 'Unknown'
+    
+    @staticmethod
+    def _build_ml_result(drug1, drug2, predicted_severity, confidence):
+        """Interaction result dict for a pair, worded with the caller's drug names"""
+        return {
+            'severity': predicted_severity,
+            'confidence': confidence,
+            'description': f"ML predicted {predicted_severity} interaction between {drug1} and {drug2}",
+            'recommendation': f"Consult healthcare provider before combining {drug1} and {drug2}",
+            'source': 'ML Model'
+        }
     
     def get_database_interaction(self, drug1, drug2):
         """Get interaction from database"""
-        query = """
-            SELECT * FROM interactions 
-            WHERE (drug1 = %s AND drug2 = %s) OR (drug1 = %s AND drug2 = %s)
-            ORDER BY 
-                CASE severity_level 
-                    WHEN 'High' THEN 1 
-                    WHEN 'Medium' THEN 2 
-                    WHEN 'Low' THEN 3 
-                    ELSE 4 
-                END
-            LIMIT 1
-        """
-        result = execute_query(query, (drug1, drug2, drug2, drug1))
+        key = self._pair_key(drug1, drug2)
+        with self._cache_lock:
+            if key in self._database_cache:
+                return self._database_cache[key]
         
+        result = execute_query(_Q_INTERACTION, (drug1, drug2, drug2, drug1))
+        
+        interaction = None
         if result and result[0]:
-            interaction = result[0]
-            return {
-                'severity': interaction['severity_level'],
+            row = result[0]
+            interaction = {
+                'severity': row['severity_level'],
                 'confidence': 0.9,  # High confidence for database results
-                'description': interaction['description'],
-                'recommendation': interaction['recommendation'],
+                'description': row['description'],
+                'recommendation': row['recommendation'],
                 'source': 'Database'
             }
         
-        return None
+        # Don't remember connection/query failures (execute_query returns None)
+        if result is not None:
+            with self._cache_lock:
+                self._database_cache[key] = interaction
+        
+        return interaction
+    
+    def get_database_interactions(self, pairs):
+        """Get interactions for many pairs from database, overlapping the round-trips"""
+        if len(pairs) <= 1:
+            return [self.get_database_interaction(drug1, drug2) for drug1, drug2 in pairs]
+        
+        # Each lookup opens its own connection, so waits can run in parallel
+        with ThreadPoolExecutor(max_workers=min(8, len(pairs))) as executor:
+            return list(executor.map(lambda pair: self.get_database_interaction(*pair), pairs))
+    
+    def get_known_pairs(self):
+        """Normalized pairs present in the interactions table, refreshed every few minutes"""
+        with self._cache_lock:
+            if 'pairs' in self._known_pairs_cache:
+                return self._known_pairs_cache['pairs']
+        
+        rows = execute_query(_Q_KNOWN_PAIRS)
+        if rows is None:
+            return None
+        
+        known_pairs = frozenset(self._pair_key(row['drug1'], row['drug2']) for row in rows)
+        with self._cache_lock:
+            self._known_pairs_cache['pairs'] = known_pairs
+        return known_pairs
     
     def check_multiple_interactions(self, medicines):
         """Check interactions between multiple medicines"""
-        interactions = []
+        names = [med['medicine_name'] for med in medicines]
+        pairs = list(combinations(names, 2))
         
-        for i in range(len(medicines)):
-            for j in range(i + 1, len(medicines)):
-                drug1 = medicines[i]['medicine_name']
-                drug2 = medicines[j]['medicine_name']
-                
-                interaction = self.predict_interaction_severity(drug1, drug2)
-                if interaction:
-                    interactions.append({
-                        'drug1': drug1,
-                        'drug2': drug2,
-                        **interaction
-                    })
+        # Only score pairs the interactions table knows about; if the table
+        # can't be read, score everything as before
+        known_pairs = self.get_known_pairs()
+        if known_pairs is not None:
+            pairs = [pair for pair in pairs if self._pair_key(*pair) in known_pairs]
+        
+        # One batched prediction for the remaining pairs
+        interactions = []
+        for (drug1, drug2), interaction in zip(pairs, self.predict_batch(pairs)):
+            if interaction:
+                interactions.append({
+                    'drug1': drug1,
+                    'drug2': drug2,
+                    **interaction
+                })
         
         return interactions
 
 # Global instance
 interaction_engine = DrugInteractionEngine()
+threading.Thread(target=interaction_engine.warmup, daemon=True).start()
@@ -1,42 +1,128 @@
-import pickle
+import joblib
 import pandas as pd
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.ensemble import RandomForestClassifier
 import numpy as np
+import random
+import threading
+from itertools import chain
+from functools import lru_cache
+from cachetools import TTLCache
 from database.db_config import execute_query
+from ml_engine_base import TfidfModelMixin
 
-class MedicineRecommendationEngine:
+# SQL built once at import; only the parameters change per call
+# One branch per condition; the constant tags each row with its condition
+_Q_CONDITION = """
+    (SELECT medicine_name, primary_conditions, secondary_conditions, 
+            contraindications, medical_condition, %s AS cond_idx
+     FROM medicine_recommendations 
+     WHERE primary_conditions LIKE %s OR secondary_conditions LIKE %s)
+"""
+
+_Q_CATEGORY = """
+    SELECT medicine_name, primary_conditions, secondary_conditions
+    FROM medicine_recommendations 
+    WHERE primary_conditions LIKE %s
+    LIMIT 5
+"""
+
+_Q_RELATED = """
+    (SELECT medicine_name, primary_conditions, secondary_conditions
+     FROM medicine_recommendations 
+     WHERE medicine_name != %s 
+     AND (primary_conditions LIKE %s OR secondary_conditions LIKE %s)
+     LIMIT 3)
+"""
+
+_Q_USER_MEDICINES = """
+    SELECT medicine_name FROM user_medicines 
+    WHERE user_id = %s AND status = 'active'
+"""
+
+_Q_RECOMMENDATION_IDS = "SELECT id FROM medicine_recommendations"
+
+# Variable-arity queries, built once per placeholder count
+@lru_cache(maxsize=32)
+def _conditions_query(count):
+    # Rows grouped per condition in argument order, by name within each,
+    # i.e. what one query per condition would return, concatenated
+    return f"""
+        SELECT medicine_name, primary_conditions, secondary_conditions, 
+               contraindications, medical_condition
+        FROM (
+            {' UNION ALL '.join([_Q_CONDITION] * count)}
+        ) AS matched
+        ORDER BY cond_idx, medicine_name
+    """
+
+@lru_cache(maxsize=32)
+def _related_query(count):
+    # Wrapped in an outer SELECT so execute_query fetches the rows
+    return f"""
+        SELECT * FROM (
+            {' UNION ALL '.join([_Q_RELATED] * count)}
+        ) AS related
+        LIMIT 10
+    """
+
+@lru_cache(maxsize=16)
+def _ids_query(count):
+    placeholders = ', '.join(['%s'] * count)
+    return f"""
+        SELECT medicine_name, primary_conditions, secondary_conditions
+        FROM medicine_recommendations 
+        WHERE id IN ({placeholders})
+    """
+
+class MedicineRecommendationEngine(TfidfModelMixin):
     def __init__(self):
         self.model = None
         self.tfidf = None
         self.label_encoder = None
+        # Short-lived caches so identical LIKE queries don't hit MySQL repeatedly
+        self._condition_cache = TTLCache(maxsize=512, ttl=300)
+        self._category_cache = TTLCache(maxsize=512, ttl=300)
+        self._id_cache = TTLCache(maxsize=1, ttl=300)
+        self._cache_lock = threading.Lock()
         self.load_model()
     
     def load_model(self):
         try:
-            # Try to load trained model files
-            with open('ml/Models/recommendation_model.pkl', 'rb') as f:
-                self.model = pickle.load(f)
-            with open('ml/Models/recommendation_tfidf.pkl', 'rb') as f:
-                self.tfidf = pickle.load(f)
-            with open('ml/Models/recommendation_label_encoder.pkl', 'rb') as f:
-                self.label_encoder = pickle.load(f)
+            # Try to load trained model files; numpy arrays are memory-mapped
+            # read-only so forked workers share the pages
+            self.model = joblib.load('ml/Models/recommendation_model.pkl', mmap_mode='r')
+            self.tfidf = joblib.load('ml/Models/recommendation_tfidf.pkl', mmap_mode='r')
+            self.label_encoder = joblib.load('ml/Models/recommendation_label_encoder.pkl')
             print("✅ ML Recommendation Model loaded successfully!")
         except FileNotFoundError:
             print("⚠️ ML Recommendation Model files not found, using database lookup")
             self.model = None
+            return
+        self.load_onnx_session('ml/Models/recommendation.onnx')
+    
+    def _cached_query(self, cache, key, query, params=None):
+        """Rows for query from cache or MySQL; failures (None) are not cached"""
+        with self._cache_lock:
+            if key in cache:
+                return cache[key]
+        
+        rows = execute_query(query, params)
+        if rows is not None:
+            with self._cache_lock:
+                cache[key] = rows
+        return rows
     
-    def get_recommendations_by_condition(self, condition):
-        """Get recommendations from database based on condition"""
-        query = """
-            SELECT medicine_name, primary_conditions, secondary_conditions, 
-                   contraindications, medical_condition
-            FROM medicine_recommendations 
-            WHERE primary_conditions LIKE %s OR secondary_conditions LIKE %s
-            ORDER BY medicine_name
-        """
-        results = execute_query(query, (f'%{condition}%', f'%{condition}%'))
-        return results or []
+    def get_recommendations_by_conditions(self, conditions):
+        """Get recommendations for several conditions in one query, grouped per condition"""
+        if not conditions:
+            return []
+        
+        params = []
+        for idx, condition in enumerate(conditions):
+            params.extend((idx, f'%{condition}%', f'%{condition}%'))
+        return self._cached_query(self._condition_cache, tuple(conditions),
+                                  _conditions_query(len(conditions)), params) or []
     
     def get_recommendations_by_ml(self, user_medicines):
         """Get ML-powered recommendations based on user's current medicines"""
@@ -47,15 +133,18 @@ class MedicineRecommendationEngine:
             # Combine user medicines into text
             medicine_text = ' '.join([med['medicine_name'] for med in user_medicines])
             
-            # Transform using TF-IDF
-            X = self.tfidf.transform([medicine_text])
-            
-            # Get prediction probabilities
-            probabilities = self.model.predict_proba(X)[0]
+            # Get prediction probabilities (TF-IDF + model)
+            probabilities = self._predict_proba([medicine_text])[0]
             classes = self.label_encoder.classes_
             
-            # Get top 5 recommendations
-            top_indices = np.argsort(probabilities)[-5:][::-1]
+            # Nothing clears the confidence bar
+            if probabilities.max() <= 0.1:
+                return []
+            
+            # Get top 5 recommendations (O(K) partition, then sort only those)
+            k = min(5, len(probabilities))
+            top = np.argpartition(probabilities, -k)[-k:]
+            top_indices = top[np.argsort(probabilities[top])[::-1]]
             recommendations = []
             
             for idx in top_indices:
@@ -73,42 +162,25 @@ class MedicineRecommendationEngine:
     
     def get_medicines_by_category(self, category):
         """Get medicines from database by category"""
-        query = """
-            SELECT medicine_name, primary_conditions, secondary_conditions
-            FROM medicine_recommendations 
-            WHERE primary_conditions LIKE %s
-            LIMIT 5
-        """
-        return execute_query(query, (f'%{category}%',)) or []
+        return self._cached_query(self._category_cache, category, _Q_CATEGORY, (f'%{category}%',)) or []
     
     def get_fallback_recommendations(self, user_medicines):
         """Fallback recommendations based on user's current medicines"""
-        recommendations = []
+        if not user_medicines:
+            return []
         
+        # Up to 3 related medicines per user medicine, all in one round-trip
+        params = []
         for med in user_medicines:
-            # Get related medicines from database
-            query = """
-                SELECT medicine_name, primary_conditions, secondary_conditions
-                FROM medicine_recommendations 
-                WHERE medicine_name != %s 
-                AND (primary_conditions LIKE %s OR secondary_conditions LIKE %s)
-                LIMIT 3
-            """
             med_name = med['medicine_name']
-            related = execute_query(query, (med_name, f'%{med_name}%', f'%{med_name}%'))
-            if related:
-                recommendations.extend(related)
+            params.extend((med_name, f'%{med_name}%', f'%{med_name}%'))
         
-        return recommendations[:10]
+        return execute_query(_related_query(len(user_medicines)), params) or []
     
     def get_smart_recommendations(self, user_id):
         """Get smart recommendations combining ML and database"""
         # Get user's current medicines
-        user_meds_query = """
-            SELECT medicine_name FROM user_medicines 
-            WHERE user_id = %s AND status = 'active'
-        """
-        user_medicines = execute_query(user_meds_query, (user_id,)) or []
+        user_medicines = execute_query(_Q_USER_MEDICINES, (user_id,)) or []
         
         if not user_medicines:
             # If no medicines, show general recommendations
@@ -117,34 +189,43 @@ class MedicineRecommendationEngine:
         # Get ML-powered recommendations
         ml_recs = self.get_recommendations_by_ml(user_medicines)
         
-        # Get condition-based recommendations
-        condition_recs = []
-        for med in user_medicines:
-            # Extract condition from medicine name or get from database
-            condition_recs.extend(self.get_recommendations_by_condition(med['medicine_name']))
+        # Get condition-based recommendations, one query for all medicines
+        condition_recs = self.get_recommendations_by_conditions([med['medicine_name'] for med in user_medicines])
+        
+        # Combine and deduplicate, keeping first occurrence order
+        unique_recs = {}
+        for rec in chain(ml_recs, condition_recs):
+            unique_recs.setdefault(rec['medicine_name'], rec)
         
-        # Combine and deduplicate
-        all_recs = ml_recs + condition_recs
-        seen = set()
-        unique_recs = []
+        return list(unique_recs.values())[:15]  # Return top 15
+    
+    def get_recommendation_ids(self):
+        """All recommendation ids, refreshed every few minutes"""
+        with self._cache_lock:
+            if 'ids' in self._id_cache:
+                return self._id_cache['ids']
         
-        for rec in all_recs:
-            key = rec['medicine_name']
-            if key not in seen:
-                seen.add(key)
-                unique_recs.append(rec)
+        rows = execute_query(_Q_RECOMMENDATION_IDS)
+        if rows is None:
+            return ()
         
-        return unique_recs[:15]  # Return top 15
+        ids = tuple(row['id'] for row in rows)
+        with self._cache_lock:
+            self._id_cache['ids'] = ids
+        return ids
     
     def get_general_recommendations(self):
         """Get general recommendations when user has no medicines"""
-        query = """
-            SELECT medicine_name, primary_conditions, secondary_conditions
-            FROM medicine_recommendations 
-            ORDER BY RAND()
-            LIMIT 10
-        """
-        return execute_query(query) or []
+        # Sample ids in memory instead of ORDER BY RAND(), which sorts the whole table
+        ids = self.get_recommendation_ids()
+        if not ids:
+            return []
+        
+        sample = random.sample(ids, min(10, len(ids)))
+        recommendations = list(execute_query(_ids_query(len(sample)), sample) or [])
+        random.shuffle(recommendations)
+        return recommendations
 
 # Global instance
 recommendation_engine = MedicineRecommendationEngine()
+threading.Thread(target=recommendation_engine.warmup, daemon=True).start()
@@ -1,158 +1,382 @@
 """
 OCR Service for Prescription Text Extraction
 """
-import re
+import hashlib
+import logging
 import os
-import tempfile
-from typing import Dict, Optional
+import queue
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from functools import lru_cache
+from typing import Any, Dict
 from datetime import datetime
 
 try:
-    from PIL import Image, ImageOps, ImageFilter, ImageEnhance
+    from PIL import Image
     import numpy as np
 except ImportError:
     raise ImportError("PIL and numpy required")
 
+# Per-request OCR/parse dumps, off unless OCR_DEBUG=1
+_DEBUG = os.environ.get('OCR_DEBUG') == '1'
+log = logging.getLogger(__name__)
+if _DEBUG:
+    # The app configures no logging, so give the dumps their own handler
+    log.setLevel(logging.DEBUG)
+    if not log.handlers:
+        log.addHandler(logging.StreamHandler())
+
 EASYOCR_AVAILABLE = False
 _reader = None
+_reader_ready = threading.Event()
+_reader_lock = threading.Lock()
+_warmup_pid = None
+
+# Concurrent same-size OCR requests are coalesced into one readtext_batched
+# call by a worker thread, started lazily in each process. The detector
+# holds a whole batch at once, so batches are capped by page count and by
+# total pixels (default: about two A4 pages at 300 dpi)
+OCR_MAX_BATCH = int(os.environ.get('OCR_MAX_BATCH', 4))
+OCR_MAX_BATCH_PIXELS = int(os.environ.get('OCR_MAX_BATCH_PIXELS', 18_000_000))
+_ocr_queue = queue.Queue()
+_ocr_worker_pid = None
+_ocr_worker_lock = threading.Lock()
+
+# Upper bounds on waiting for the reader to load and for a page's OCR;
+# hitting either fails the request instead of hanging it
+OCR_READER_TIMEOUT = float(os.environ.get('OCR_READER_TIMEOUT', 300))
+OCR_TIMEOUT = float(os.environ.get('OCR_TIMEOUT', 120))
+
+# OCR text per image content hash, so re-uploads skip EasyOCR entirely;
+# parsing the text is cached separately by _parse_prescription_cached
+OCR_CACHE_SIZE = 128
+_OCR_CACHE = OrderedDict()
+_ocr_cache_lock = threading.Lock()
+
+# Small CPU pool for OCR inference; default torch pools oversubscribe small
+# containers. OpenMP/MKL read these when torch is first imported below.
+OCR_NUM_THREADS = min(4, os.cpu_count() or 1)
+os.environ.setdefault('OMP_NUM_THREADS', str(OCR_NUM_THREADS))
+os.environ.setdefault('MKL_NUM_THREADS', str(OCR_NUM_THREADS))
 
 try:
     import easyocr
+    import torch
     EASYOCR_AVAILABLE = True
 except Exception:
     pass
 
-def _preprocess_image(img: Image.Image) -> Image.Image:
-    """Enhance image specifically for printed text OCR (ignore handwriting)."""
-    if img.mode != 'RGB':
-        img = img.convert('RGB')
-
-    # Convert to grayscale
-    img = img.convert('L')
-    arr = np.array(img)
+# Frequency aliases per canonical frequency
+FREQ_KEYWORDS = {
+    'once daily': ['once daily', 'od', 'qd', 'daily', 'one daily'],
+    'twice daily': ['twice daily', 'bd', 'bid', '2x daily', 'two daily'],
+    'three times daily': ['three times daily', 'tds', 'tid', '3x daily', 'thrice daily'],
+    'four times daily': ['four times daily', 'qid', '4x daily', 'every 6 hours'],
+    'as needed': ['sos', 'prn', 'as needed']
+}
+_FREQ_CANONICAL = {alias: key for key, aliases in FREQ_KEYWORDS.items() for alias in aliases}
+# Longest alias first so "twice daily" wins over "daily"
+_FREQ_RE = re.compile(
+    r'\b(?:' + '|'.join(re.escape(a) for a in sorted(_FREQ_CANONICAL, key=len, reverse=True)) + r')\b',
+    re.IGNORECASE)
+
+# Prescription parsing patterns, compiled once per process
+_LINE_SPLIT_RE = re.compile(r'[\n\r]+')
+# A bare "Rx" marker line joined with the line after it
+_RX_MERGE_RE = re.compile(r'^((?:R|Rx|RxI|Rx1|Rxi|Rxl)\.?)\n(.*)$', re.IGNORECASE | re.MULTILINE)
+# Lines to skip: obvious non-med terms anywhere, or instructions like "Take one tablet..."
+_MED_SKIP_RE = re.compile(
+    r'\b(phone|address|license|npi|health|avenue|business|city|clinic|hospital|street|road|block|internal|specialist|patient|date|dob|dr|doctor|allergies|gender|weight|height|purpose|penicillin)\b'
+    r'|^(take|give|apply|use)\b',
+    re.IGNORECASE)
+_DOSAGE_CLUE_RE = re.compile(r'(mg|ml|tab|tablet|cap|capsule|syrup|drop|ointment|cream)', re.IGNORECASE)
+_LEADING_NUMBERING_RE = re.compile(r"^[\-\d\.\)\s]+")
+_LEADING_RX_RE = re.compile(r"^r\s*x\s*\d*\s*[:\.]?\s*", re.IGNORECASE)
+_LEADING_ROMAN_RE = re.compile(r'^\b[IVX]+\.\s*', re.IGNORECASE)
+_MED_DOSE_RE = re.compile(r"([A-Za-z][A-Za-z0-9\-]+)\s+(\d+(?:\.\d+)?)\s*(mg|ml|mcg|g|iu)?", re.IGNORECASE)
+# Patient fields in one scan per line. Each branch is a lookahead so one
+# field's match never consumes text another field needs; the branches
+# start with distinct keywords, so the first hit per field is the same
+# as a separate search for it.
+_FIELDS_RE = re.compile(
+    r"(?=\b(?:age|yrs?|years?)\b[\s:]*(?P<age>[0-9]{1,3}))"
+    r"|(?=\b(?:weight|wt)\b[\s:]*(?P<weight>[0-9]{1,3}(?:\.[0-9]+)?))"
+    r"|(?=\b(?:height|ht)\b[\s:]*(?P<height>[0-9]{2,3}))"
+    r"|(?=\b(?:gender|sex)\b[\s:]*(?P<gender>[A-Za-z]+))"
+    r"|(?=(?:purpose|for)\s*[:\-]?\s*(?P<purpose>.+))",
+    re.IGNORECASE)
+
+# 3-tap Gaussian for sigma=0.3 (what gaussian_filter truncates to for sigma < 0.375)
+_DENOISE_SIGMA = 0.3
+_GAUSS_TAP = float(np.exp(-1.0 / (2 * _DENOISE_SIGMA ** 2)))
+_GAUSS_SIDE = _GAUSS_TAP / (1 + 2 * _GAUSS_TAP)
+_GAUSS_CENTRE = 1 / (1 + 2 * _GAUSS_TAP)
+
+# Pages at least this sharp and large are passed to EasyOCR unenhanced
+PREPROCESS_SKIP_MIN_SIDE = 800
+PREPROCESS_SKIP_MIN_STD = 60
+
+def _neighbour_sum(src: np.ndarray, out: np.ndarray) -> None:
+    """out = left + right neighbour along the last axis, edges replicated"""
+    out[:, 1:] = src[:, :-1]
+    out[:, 0] = src[:, 0]
+    out[:, :-1] += src[:, 1:]
+    out[:, -1] += src[:, -1]
+
+def _gaussian_blur3(arr: np.ndarray, scratch: np.ndarray) -> np.ndarray:
+    """Separable 3-tap Gaussian blur in float32 with edge replication, in place"""
+    ratio = _GAUSS_SIDE / _GAUSS_CENTRE
+    _neighbour_sum(arr, scratch)
+    scratch *= ratio
+    scratch += arr
+    scratch *= _GAUSS_CENTRE
+    _neighbour_sum(scratch.T, arr.T)
+    arr *= ratio
+    arr += scratch
+    arr *= _GAUSS_CENTRE
+    return arr
+
+def _smooth(arr: np.ndarray, out: np.ndarray, scratch: np.ndarray) -> np.ndarray:
+    """PIL's ImageFilter.SMOOTH (3x3, centre weight 5, sum 13) with edge replication"""
+    _neighbour_sum(arr, scratch)
+    scratch += arr
+    _neighbour_sum(scratch.T, out.T)
+    out += scratch
+    np.multiply(arr, 4, out=scratch)
+    out += scratch
+    out /= 13
+    return out
+
+def _preprocess_image(img: Image.Image) -> np.ndarray:
+    """Enhance image specifically for printed text OCR (ignore handwriting).
+
+    Runs as a single float32 pipeline equivalent to PIL's Contrast(1.8),
+    Sharpness(2.2), autocontrast(cutoff=2) and Brightness(1.25) steps.
+    Returns a 2D uint8 grayscale array that EasyOCR reads directly.
+    """
+    # Convert to grayscale in one step (PIL handles any mode -> L directly)
+    if img.mode != 'L':
+        img = img.convert('L')
+    gray = np.asarray(img)
+
+    # Crisp, high-resolution scans (digital/PDF prescriptions) are already
+    # OCR-ready; skip the enhancement passes entirely
+    if min(gray.shape) > PREPROCESS_SKIP_MIN_SIDE and gray.std() > PREPROCESS_SKIP_MIN_STD:
+        return gray
+
+    # One float32 working copy plus two reusable buffers for the filters
+    arr = gray.astype(np.float32)
+    scratch = np.empty_like(arr)
+    smooth = np.empty_like(arr)
 
     # Light Gaussian denoising (remove paper noise)
-    try:
-        from scipy import ndimage
-        arr = ndimage.gaussian_filter(arr, sigma=0.3)
-    except ImportError:
-        img = img.filter(ImageFilter.MedianFilter(size=3))
-        arr = np.array(img)
-
-    img = Image.fromarray(arr)
-
-    # Boost clarity & contrast for printed fonts
-    img = ImageEnhance.Contrast(img).enhance(1.8)
-    img = ImageEnhance.Sharpness(img).enhance(2.2)
-    img = ImageOps.autocontrast(img, cutoff=2)
-
-    # Slight brightness boost if background is dark
-    if np.mean(arr) < 125:
-        img = ImageEnhance.Brightness(img).enhance(1.25)
-
-    return img
+    _gaussian_blur3(arr, scratch)
+
+    mean = float(arr.mean())
+
+    # Boost clarity & contrast for printed fonts: contrast around the mean,
+    # then unsharp mask against the smoothed image
+    arr *= 1.8
+    arr -= 0.8 * mean
+    np.clip(arr, 0, 255, out=arr)
+    _smooth(arr, smooth, scratch)
+    arr -= smooth
+    arr *= 2.2
+    arr += smooth
+    np.clip(arr, 0, 255, out=arr)
+
+    # Autocontrast (stretch the 2nd-98th percentile range to 0-255) and a
+    # slight brightness boost if the background is dark, as one affine pass
+    lo, hi = np.percentile(arr, [2, 98])
+    gain = 1.25 if mean < 125 else 1.0
+    if hi > lo:
+        gain *= 255.0 / (hi - lo)
+        arr -= lo
+    if gain != 1.0:
+        arr *= gain
+
+    np.clip(arr, 0, 255, out=arr)
+    return arr.astype(np.uint8)
+
+# One pass over each OCR line: punctuation spacing, whitespace runs,
+# "0D" misread and digit+unit spacing (e.g. "500MG" -> "500 mg")
+_CLEAN_RE = re.compile(r'\s*([,.:;!?])\s*|(\s+)|\b0D\b|\b(\d+)\s*(?i:(MG|ML|MCG))\b')
+
+def _clean_repl(m: re.Match) -> str:
+    # Dispatch on the last group that matched; the "0D" branch has none
+    g = m.lastindex
+    if g == 1:
+        return m.group(1) + ' '
+    if g == 2:
+        return ' '
+    if g == 4:
+        return f"{m.group(3)} {m.group(4).lower()}"
+    return 'OD'
 
 def _clean_text(text: str) -> str:
     """Normalize OCR output"""
     if not text:
         return text
     
+    return '\n'.join(
+        _CLEAN_RE.sub(_clean_repl, line)
+        for line in map(str.strip, text.split('\n'))
+        if line
+    )
+
+_READTEXT_KWARGS = dict(
+    detail=1,
+    paragraph=False,
+    width_ths=0.6,
+    height_ths=0.6,
+    text_threshold=0.7,
+    contrast_ths=0.3,
+    adjust_contrast=0.6,
+    mag_ratio=1.0,
+    slope_ths=0.1,
+    ycenter_ths=0.5,
+)
+
+def _run_jobs(jobs, read) -> None:
+    """Resolve each job's future from one read() call over their pages"""
+    try:
+        results = read([arr for arr, _ in jobs])
+    except Exception as e:
+        for _, future in jobs:
+            future.set_exception(e)
+        return
+    for (_, future), result in zip(jobs, results):
+        future.set_result(result)
+
+def _ocr_worker(jobs_queue: queue.Queue) -> None:
+    """Drain queued pages and OCR whatever is waiting; never waits to fill a batch"""
+    while True:
+        jobs = [jobs_queue.get()]
+        while len(jobs) < OCR_MAX_BATCH:
+            try:
+                jobs.append(jobs_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        # Skip pages whose request already timed out
+        jobs = [job for job in jobs if job[1].set_running_or_notify_cancel()]
+
+        # EasyOCR scales each page by its own size, so only identical shapes
+        # are batched; a batch page is then detected exactly as it is alone
+        by_shape = {}
+        for job in jobs:
+            by_shape.setdefault(job[0].shape, []).append(job)
+        for group in by_shape.values():
+            per_batch = max(1, min(OCR_MAX_BATCH, OCR_MAX_BATCH_PIXELS // group[0][0].size))
+            for start in range(0, len(group), per_batch):
+                batch = group[start:start + per_batch]
+                if len(batch) == 1:
+                    _run_jobs(batch, lambda arrays: [_reader.readtext(arrays[0], **_READTEXT_KWARGS)])
+                else:
+                    _run_jobs(batch, lambda arrays: _reader.readtext_batched(
+                        arrays, batch_size=len(arrays), **_READTEXT_KWARGS))
+
+def _reset_after_fork() -> None:
+    """Threads don't survive fork; let the child start its own worker and reader"""
+    global _ocr_queue, _ocr_worker_pid, _ocr_worker_lock, _reader_lock, _ocr_cache_lock
+    _ocr_queue = queue.Queue()
+    _ocr_worker_pid = None
+    _ocr_worker_lock = threading.Lock()
+    _reader_lock = threading.Lock()
+    _ocr_cache_lock = threading.Lock()
+
+def _ensure_worker() -> None:
+    global _ocr_worker_pid
+    if _ocr_worker_pid == os.getpid():
+        return
+    with _ocr_worker_lock:
+        if _ocr_worker_pid != os.getpid():
+            threading.Thread(target=_ocr_worker, args=(_ocr_queue,), daemon=True).start()
+            _ocr_worker_pid = os.getpid()
+
+def _ensure_reader() -> None:
+    global _reader
+    # Wait for the startup warmup unless it was started in a parent process
+    # (fork before it finished); then build here, once across requests
+    if _warmup_pid == os.getpid() and not _reader_ready.wait(OCR_READER_TIMEOUT):
+        raise RuntimeError("OCR failed: the EasyOCR reader is still loading, please try again.")
+    if _reader is None:
+        with _reader_lock:
+            if _reader is None:
+                _configure_torch_threads()
+                _reader = _build_reader()
+
+def _submit_page(image: Image.Image) -> Future:
+    _ensure_worker()
+    future = Future()
+    _ocr_queue.put((_preprocess_image(image), future))
+    return future
+
+def _wait_for_page(future: Future) -> list:
+    try:
+        return future.result(timeout=OCR_TIMEOUT)
+    except FutureTimeoutError:
+        future.cancel()
+        raise RuntimeError("OCR failed: timed out waiting for text recognition, please try again.")
+
+def _filtered_clean(results) -> str:
+    """Confidence filter and _clean_text normalization in a single pass over the detections"""
     lines = []
-    for line in text.split('\n'):
-        line = line.strip()
-        if not line:
+    for _, t, conf in results:
+        # Keep only printed/high-confidence text (ignore faint/handwritten)
+        if conf < 0.55:
             continue
-        
-        line = re.sub(r'\s+', ' ', line)
-        line = re.sub(r'\s*([,.:;!?])\s*', r'\1 ', line)
-        line = re.sub(r'\b0D\b', 'OD', line)
-        line = re.sub(r'\bBD\b', 'BD', line)
-        line = re.sub(r'\bTDS\b', 'TDS', line)
-        line = re.sub(r'\bQID\b', 'QID', line)
-        line = re.sub(r'\b(\d+)\s*MG\b', r'\1 mg', line, flags=re.IGNORECASE)
-        line = re.sub(r'\b(\d+)\s*ML\b', r'\1 ml', line, flags=re.IGNORECASE)
-        line = re.sub(r'\b(\d+)\s*MCG\b', r'\1 mcg', line, flags=re.IGNORECASE)
-        
-        lines.append(line)
-    
+        for line in t.split('\n'):
+            line = line.strip()
+            if line:
+                lines.append(_CLEAN_RE.sub(_clean_repl, line))
     return '\n'.join(lines)
 
+def _results_to_text(results) -> str:
+    text = _filtered_clean(results)
+
+    if not text:
+        raise RuntimeError("No clear printed text detected. Please upload a well-lit printed prescription.")
+
+    return text
+
 def extract_text_from_image(image: Image.Image) -> str:
     """Extract text using EasyOCR (optimized for printed text only)."""
-    global _reader
+    return extract_text_from_images([image])[0]
 
+def extract_text_from_images(images) -> list:
+    """Extract text from several images, sharing EasyOCR batches with concurrent requests"""
     if not EASYOCR_AVAILABLE:
         raise RuntimeError("EasyOCR not available. Install using: pip install easyocr torch torchvision")
 
-    if _reader is None:
-        _reader = easyocr.Reader(['en'], gpu=False, quantize=True)
+    _ensure_reader()
+    futures = [_submit_page(image) for image in images]
+    return [_results_to_text(_wait_for_page(future)) for future in futures]
 
-    image = _preprocess_image(image)
-
-    with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp:
-        image.save(tmp.name, format='PNG', quality=100, optimize=True)
-        tmp_path = tmp.name
-
-    try:
-        results = _reader.readtext(
-            tmp_path,
-            detail=1,
-            paragraph=False,
-            width_ths=0.6,
-            height_ths=0.6,
-            text_threshold=0.7,
-            contrast_ths=0.3,
-            adjust_contrast=0.6,
-            mag_ratio=1.0,
-            slope_ths=0.1,
-            ycenter_ths=0.5,
-        )
-
-        # Keep only printed/high-confidence text (ignore faint/handwritten)
-        lines = [t for _, t, conf in results if conf >= 0.55]
-        text = "\n".join(lines)
-
-        if not text.strip():
-            raise RuntimeError("No clear printed text detected. Please upload a well-lit printed prescription.")
+def parse_prescription_text(text: str) -> Dict[str, Any]:
+    """Parse multiple medicines (name, dosage, frequency) and other fields from OCR text"""
+    data = _parse_prescription_cached(text)
+    # Hand out a copy so callers can't mutate the cached entry
+    return {**data, 'medicines': [dict(m) for m in data['medicines']]}
 
-        return _clean_text(text)
+@lru_cache(maxsize=512)
+def _parse_prescription_cached(text: str) -> Dict[str, Any]:
+    """Parsing is a pure function of the OCR text, so re-uploads hit this cache"""
+    lines = [ln for ln in map(str.strip, _LINE_SPLIT_RE.split(text)) if ln]
 
-    finally:
-        try:
-            os.remove(tmp_path)
-        except Exception:
-            pass
+    # Smart merge for OCR artifacts like "Rx" + "I. Amlodipine", done by the
+    # regex engine over the normalized text instead of a Python loop
+    lines = _RX_MERGE_RE.sub(r'\1 \2', '\n'.join(lines)).split('\n') if lines else []
 
-def parse_prescription_text(text: str) -> Dict[str, Optional[str]]:
-    """Parse multiple medicines (name, dosage, frequency) and other fields from OCR text"""
-    lines = re.split(r'[\n\r]+', text)
-    lines = [ln.strip() for ln in lines if ln.strip()]
-
-    # Smart merge for OCR artifacts like "Rx" + "I. Amlodipine"
-    merged_lines = []
-    skip_next = False
-    for i, ln in enumerate(lines):
-        if skip_next:
-            skip_next = False
-            continue
-        if re.fullmatch(r'(R|Rx|RxI|Rx1|Rxi|Rxl)\.?\s*', ln.strip(), re.IGNORECASE):
-            if i + 1 < len(lines):
-                merged_lines.append(f"{ln.strip()} {lines[i+1].strip()}")
-                skip_next = True
-            else:
-                merged_lines.append(ln)
-        else:
-            merged_lines.append(ln)
-    lines = merged_lines
-
-    # === DEBUG ===
-    print("\nDebug: Merged Lines:")
-    for i, ln in enumerate(lines):
-        print(f"{i+1:02d}: {ln}")
-    # ==============
+    if _DEBUG:
+        log.debug("Merged lines:\n%s", "\n".join(f"{i+1:02d}: {ln}" for i, ln in enumerate(lines)))
 
+    medicines = []
+    seen_names = set()
     data = {
-        'medicines': [],
+        'medicines': medicines,
         'age': None,
         'weight': None,
         'height': None,
@@ -160,39 +384,25 @@ def parse_prescription_text(text: str) -> Dict[str, Optional[str]]:
         'purpose': None
     }
 
-    freq_keywords = {
-        'once daily': ['once daily', 'od', 'qd', 'daily', 'one daily'],
-        'twice daily': ['twice daily', 'bd', 'bid', '2x daily', 'two daily'],
-        'three times daily': ['three times daily', 'tds', 'tid', '3x daily', 'thrice daily'],
-        'four times daily': ['four times daily', 'qid', '4x daily', 'every 6 hours'],
-        'as needed': ['sos', 'prn', 'as needed']
-    }
-
     for ln in lines:
         if not ln:
             continue
 
-        # Skip obvious non-med lines
-        if re.search(
-            r'\b(phone|address|license|npi|health|avenue|business|city|clinic|hospital|street|road|block|internal|specialist|patient|date|dob|dr|doctor|allergies|gender|weight|height|purpose|penicillin)\b',
-            ln, re.IGNORECASE):
-            continue
-
-        # Skip instruction lines like "Take one tablet..."
-        if re.match(r'^(take|give|apply|use)\b', ln, re.IGNORECASE):
+        # Must have dosage clue; most lines don't, so check that first
+        if not _DOSAGE_CLUE_RE.search(ln):
             continue
 
-        # Must have dosage clue
-        if not re.search(r'(mg|ml|tab|tablet|cap|capsule|syrup|drop|ointment|cream)', ln, re.IGNORECASE):
+        # Skip obvious non-med lines and instruction lines
+        if _MED_SKIP_RE.search(ln):
             continue
 
         # Clean text
-        cand = re.sub(r"^[\-\d\.\)\s]+", "", ln)
-        cand = re.sub(r"^r\s*x\s*\d*\s*[:\.]?\s*", "", cand, flags=re.IGNORECASE)
-        cand = re.sub(r'^\b[IVX]+\.\s*', '', cand, flags=re.IGNORECASE)
+        cand = _LEADING_NUMBERING_RE.sub("", ln)
+        cand = _LEADING_RX_RE.sub("", cand)
+        cand = _LEADING_ROMAN_RE.sub('', cand)
 
         # Extract medicine + dosage
-        match = re.search(r"([A-Za-z][A-Za-z0-9\-]+)\s+(\d+(?:\.\d+)?)\s*(mg|ml|mcg|g|iu)?", cand, re.IGNORECASE)
+        match = _MED_DOSE_RE.search(cand)
         if not match:
             continue
 
@@ -200,53 +410,27 @@ def parse_prescription_text(text: str) -> Dict[str, Optional[str]]:
         dose = match.group(2) + " " + (match.group(3) or "")
 
         # Detect frequency words
-        freq = None
-        lower_ln = ln.lower()
-        for key, words in freq_keywords.items():
-            if any(k in lower_ln for k in words):
-                freq = key
-                break
+        freq_match = _FREQ_RE.search(ln)
+        freq = _FREQ_CANONICAL[freq_match.group(0).lower()] if freq_match else None
 
         # Add to medicines list if unique
-        if not any(m['name'].lower() == med_name.lower() for m in data['medicines']):
-            data['medicines'].append({
+        if med_name.lower() not in seen_names:
+            seen_names.add(med_name.lower())
+            medicines.append({
                 'name': med_name,
                 'dosage': dose.strip(),
                 'frequency': freq
             })
 
-    # Debug output
-    print("\nExtracted structured medicines:")
-    for m in data['medicines']:
-        print(m)
+    if _DEBUG:
+        log.debug("Extracted structured medicines: %s", data['medicines'])
 
     # Still parse other fields (optional)
     for ln in lines:
-        # Age
-        if not data['age']:
-            m = re.search(r"\b(age|yrs?|years?)\b[\s:]*([0-9]{1,3})", ln, re.IGNORECASE)
-            if m:
-                data['age'] = m.group(2)
-        # Weight
-        if not data['weight']:
-            m = re.search(r"\b(weight|wt)\b[\s:]*([0-9]{1,3}(?:\.[0-9]+)?)", ln, re.IGNORECASE)
-            if m:
-                data['weight'] = m.group(2)
-        # Height
-        if not data['height']:
-            m = re.search(r"\b(height|ht)\b[\s:]*([0-9]{2,3})", ln, re.IGNORECASE)
-            if m:
-                data['height'] = m.group(2)
-        # Gender
-        if not data['gender']:
-            m = re.search(r"\b(gender|sex)\b[\s:]*([A-Za-z]+)", ln, re.IGNORECASE)
-            if m:
-                data['gender'] = m.group(2)
-        # Purpose
-        if not data['purpose']:
-            m = re.search(r"(purpose|for)\s*[:\-]?\s*(.+)", ln, re.IGNORECASE)
-            if m:
-                data['purpose'] = m.group(2).strip()
+        for m in _FIELDS_RE.finditer(ln):
+            field = m.lastgroup
+            if not data[field]:
+                data[field] = m.group(field).strip() if field == 'purpose' else m.group(field)
 
     return data
 
@@ -257,13 +441,35 @@ def parse_prescription_text(text: str) -> Dict[str, Optional[str]]:
 
 
 
+def _image_key(image: Image.Image) -> bytes:
+    """Content hash of the decoded image; mode and size included so equal bytes can't collide"""
+    digest = hashlib.blake2b(f"{image.mode}:{image.size}".encode(), digest_size=16)
+    digest.update(image.tobytes())
+    return digest.digest()
+
+def _cached_text_from_image(image: Image.Image) -> str:
+    """OCR text for an image, reusing the result when the same image is uploaded again"""
+    key = _image_key(image)
+    with _ocr_cache_lock:
+        text = _OCR_CACHE.get(key)
+        if text is not None:
+            _OCR_CACHE.move_to_end(key)
+            return text
+
+    # Failures raise and are not cached
+    text = extract_text_from_image(image)
+    with _ocr_cache_lock:
+        _OCR_CACHE[key] = text
+        if len(_OCR_CACHE) > OCR_CACHE_SIZE:
+            _OCR_CACHE.popitem(last=False)
+    return text
+
 def extract_prescription_data(image: Image.Image) -> Dict:
     """Complete extraction pipeline"""
     try:
-        text = extract_text_from_image(image)
-        print("\n================ OCR RAW TEXT OUTPUT ================\n")
-        print(text)
-        print("\n=====================================================\n")
+        text = _cached_text_from_image(image)
+        if _DEBUG:
+            log.debug("OCR raw text output:\n%s", text)
         data = parse_prescription_text(text)
 
         
@@ -285,4 +491,41 @@ def extract_prescription_data(image: Image.Image) -> Dict:
 
 def is_ocr_available() -> bool:
     """Check if EasyOCR is available"""
-    return EASYOCR_AVAILABLE
\ No newline at end of file
+    return EASYOCR_AVAILABLE
+
+
+def _configure_torch_threads() -> None:
+    """Pin torch intra-op threads and use a single inter-op thread"""
+    torch.set_num_threads(OCR_NUM_THREADS)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Only settable before any inter-op work has started
+        pass
+
+
+def _build_reader():
+    """Create the EasyOCR reader"""
+    # quantize=True already applies dynamic int8 quantization on CPU
+    return easyocr.Reader(['en'], gpu=False, quantize=True)
+
+
+def _warmup_reader() -> None:
+    """Load the EasyOCR reader and run a dummy image through it off the request path"""
+    global _reader
+    try:
+        _configure_torch_threads()
+        reader = _build_reader()
+        reader.readtext(np.zeros((32, 32), dtype=np.uint8))
+        _reader = reader
+    except Exception as e:
+        print(f"EasyOCR warmup error: {e}")
+    finally:
+        _reader_ready.set()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+if EASYOCR_AVAILABLE:
+    _warmup_pid = os.getpid()
+    threading.Thread(target=_warmup_reader, daemon=True).start()